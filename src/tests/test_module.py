@@ -4,12 +4,28 @@ import pytest
 import time
 import __builtin__
 import math
+import itertools
+from operator import itemgetter
 from rmtest import ModuleTestCase
 
 class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file__)) + '/../redistimeseries.so')):
     def _get_ts_info(self, redis, key):
         info = redis.execute_command('TS.INFO', key)
-        return dict([(info[i], info[i+1]) for i in range(0, len(info), 2)])
+        it = iter(info)
+        return dict(zip(it, it))
+
+    @staticmethod
+    def _expected_info_list(last_timestamp, retention_secs, chunk_count, max_samples_per_chunk, labels, rules):
+        """
+        Build the expected TS.INFO reply, in the order the module replies with, so it can be compared as is
+        :return: flat list of alternating field names and values
+        """
+        return ['lastTimestamp', last_timestamp,
+                'retentionSecs', retention_secs,
+                'chunkCount', chunk_count,
+                'maxSamplesPerChunk', max_samples_per_chunk,
+                'labels', labels,
+                'rules', rules]
 
     @staticmethod
     def _insert_data(redis, key, start_ts, samples_count, value):
@@ -22,9 +38,21 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
         :param value: could be a list of samples_count values, or one value. if a list, insert the values in their
         order, if not, insert the single value for all the timestamps
         """
-        for i in range(samples_count):
-            value_to_insert = value[i] if type(value) == list else value
-            assert redis.execute_command('TS.ADD', key, start_ts + i, value_to_insert)
+        # the module has no bulk insert command, so batch the TS.ADDs in a single round trip instead.
+        # if we were given a pipeline, just queue the commands and let the caller execute it
+        is_pipeline = hasattr(redis, 'execute')
+        pipe = redis if is_pipeline else redis.pipeline(transaction=False)
+        ts_iter = xrange(start_ts, start_ts + samples_count)
+        if isinstance(value, list):
+            # izip stops at the shorter input, so a short list would silently insert fewer samples
+            assert len(value) >= samples_count
+            val_iter = value
+        else:
+            val_iter = itertools.repeat(value, samples_count)
+        for ts, value_to_insert in itertools.izip(ts_iter, val_iter):
+            pipe.execute_command('TS.ADD', key, ts, value_to_insert)
+        if not is_pipeline:
+            assert all(pipe.execute())
 
     def _insert_agg_data(self, redis, key, agg_type):
         agg_key = '%s_agg_%s_10' % (key, agg_type)
@@ -34,8 +62,8 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
         assert redis.execute_command('TS.CREATERULE', key, agg_key, "AGGREGATION", agg_type, 10)
 
         values = (31, 41, 59, 26, 53, 58, 97, 93, 23, 84)
-        for i in range(10, 50):
-            assert redis.execute_command('TS.ADD', key, i, i // 10 * 100 + values[i % 10])
+        samples = [i // 10 * 100 + values[i % 10] for i in xrange(10, 50)]
+        self._insert_data(redis, key, 10, len(samples), samples)
 
         return agg_key
 
@@ -46,7 +74,7 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
         :param ts_key_result: the output of ts.range command (pairs of timestamp and value)
         :return: float values of all the values in the series
         """
-        return [float(value[1]) for value in ts_key_result]
+        return map(float, map(itemgetter(1), ts_key_result))
 
     @staticmethod
     def _calc_downsampling_series(values, bucket_size, calc_func):
@@ -58,14 +86,8 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
         :param calc_func: function that calculates the wanted rule, for example min/sum/avg
         :return: the values of the series after downsampling
         """
-        series = []
-        for i in range(0, int(math.ceil(len(values) / float(bucket_size)))):
-            curr_bucket_size = bucket_size
-            # we don't have enough values for a full bucket anymore
-            if (i + 1) * bucket_size > len(values):
-                curr_bucket_size = len(values) - i
-            series.append(calc_func(values[i * bucket_size: i * bucket_size + curr_bucket_size]))
-        return series
+        # slicing past the end of the list clamps, so the last bucket simply gets the remainder
+        return [calc_func(values[i:i + bucket_size]) for i in xrange(0, len(values), bucket_size)]
 
     def calc_rule(self, rule, values, bucket_size):
         """
@@ -90,18 +112,17 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
                                      'brown', 'color', 'pink')
             self._insert_data(r, 'tester', start_ts, samples_count, 5)
 
-            expected_result = [[start_ts+i, str(5)] for i in range(samples_count)]
+            expected_result = [[start_ts+i, '5'] for i in xrange(samples_count)]
             actual_result = r.execute_command('TS.range', 'tester', start_ts, start_ts + samples_count)
             assert expected_result == actual_result
 
-            expected_result = {'chunkCount': math.ceil((samples_count + 1) / 360.0),
-              'labels': [['name', 'brown'], ['color', 'pink']],
-              'lastTimestamp': start_ts + samples_count - 1,
-              'maxSamplesPerChunk': 360L,
-              'retentionSecs': 0L,
-              'rules': []}
-            actual_result = self._get_ts_info(r, 'tester')
-            assert expected_result == actual_result
+            expected_result = self._expected_info_list(last_timestamp=start_ts + samples_count - 1,
+                                                       retention_secs=0L,
+                                                       chunk_count=math.ceil((samples_count + 1) / 360.0),
+                                                       max_samples_per_chunk=360L,
+                                                       labels=[['name', 'brown'], ['color', 'pink']],
+                                                       rules=[])
+            assert expected_result == r.execute_command('TS.INFO', 'tester')
 
 
     def test_rdb(self):
@@ -109,28 +130,30 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
         samples_count = 1500
         data = None
         with self.redis() as r:
-            assert r.execute_command('TS.CREATE', 'tester', 'RETENTION', '0', 'CHUNK_SIZE', '360', 'LABELS', 'name', 'brown', 'color', 'pink')
-            assert r.execute_command('TS.CREATE', 'tester_agg_avg_10')
-            assert r.execute_command('TS.CREATE', 'tester_agg_max_10')
-            assert r.execute_command('TS.CREATERULE', 'tester', 'tester_agg_avg_10', 'AGGREGATION', 'AVG', 10)
-            assert r.execute_command('TS.CREATERULE', 'tester', 'tester_agg_max_10', 'AGGREGATION', 'MAX', 10)
-            self._insert_data(r, 'tester', start_ts, samples_count, 5)
+            with r.pipeline(transaction=False) as p:
+                p.execute_command('TS.CREATE', 'tester', 'RETENTION', '0', 'CHUNK_SIZE', '360', 'LABELS', 'name', 'brown', 'color', 'pink')
+                p.execute_command('TS.CREATE', 'tester_agg_avg_10')
+                p.execute_command('TS.CREATE', 'tester_agg_max_10')
+                p.execute_command('TS.CREATERULE', 'tester', 'tester_agg_avg_10', 'AGGREGATION', 'AVG', 10)
+                p.execute_command('TS.CREATERULE', 'tester', 'tester_agg_max_10', 'AGGREGATION', 'MAX', 10)
+                self._insert_data(p, 'tester', start_ts, samples_count, 5)
+                assert all(p.execute())
             data = r.execute_command('dump', 'tester')
 
         with self.redis() as r:
             r.execute_command('RESTORE', 'tester', 0, data)
-            expected_result = [[start_ts+i, str(5)] for i in range(samples_count)]
+            expected_result = [[start_ts+i, '5'] for i in xrange(samples_count)]
             actual_result = r.execute_command('TS.range', 'tester', start_ts, start_ts + samples_count)
             assert expected_result == actual_result
 
-            expected_result = {'chunkCount': math.ceil((samples_count + 1) / 360.0),
-                               'labels': [['name', 'brown'], ['color', 'pink']],
-                               'lastTimestamp': 1511887408L,
-                               'maxSamplesPerChunk': 360L,
-                               'retentionSecs': 0L,
-                               'rules': [['tester_agg_avg_10', 10L, 'AVG'], ['tester_agg_max_10', 10L, 'MAX']]}
-            actual_result = self._get_ts_info(r, 'tester')
-            assert expected_result == actual_result
+            expected_result = self._expected_info_list(last_timestamp=1511887408L,
+                                                       retention_secs=0L,
+                                                       chunk_count=math.ceil((samples_count + 1) / 360.0),
+                                                       max_samples_per_chunk=360L,
+                                                       labels=[['name', 'brown'], ['color', 'pink']],
+                                                       rules=[['tester_agg_avg_10', 10L, 'AVG'],
+                                                              ['tester_agg_max_10', 10L, 'MAX']])
+            assert expected_result == r.execute_command('TS.INFO', 'tester')
 
     def test_rdb_aggregation_context(self):
         """
@@ -174,7 +197,7 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
                 p.set("name", "danni")
                 self._insert_data(p, 'tester', start_ts, samples_count, 5)
                 p.execute()
-            expected_result = [[start_ts+i, str(5)] for i in range(samples_count)]
+            expected_result = [[start_ts+i, '5'] for i in xrange(samples_count)]
             actual_result = r.execute_command('TS.range', 'tester', start_ts, start_ts + samples_count)
             assert expected_result == actual_result
 
@@ -185,7 +208,7 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
             assert r.execute_command('TS.CREATE', 'tester')
             self._insert_data(r, 'tester', start_ts, samples_count, 5)
 
-            expected_result = [[start_ts+i, str(5)] for i in range(100, 151)]
+            expected_result = [[start_ts+i, '5'] for i in xrange(100, 151)]
             actual_result = r.execute_command('TS.range', 'tester', start_ts+100, start_ts + 150)
             assert expected_result == actual_result
 
@@ -215,13 +238,13 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
 
             assert len(actual_result) == samples_count/10
 
-            info_dict = self._get_ts_info(r, 'tester')
-            assert info_dict == {'chunkCount': math.ceil((samples_count + 1) / 360.0),
-                                 'lastTimestamp': start_ts + samples_count -1,
-                                 'maxSamplesPerChunk': 360L,
-                                 'retentionSecs': 0L,
-                                 'labels': [],
-                                 'rules': [['tester_agg_max_10', 10L, 'AVG']]}
+            assert r.execute_command('TS.INFO', 'tester') == \
+                self._expected_info_list(last_timestamp=start_ts + samples_count - 1,
+                                         retention_secs=0L,
+                                         chunk_count=math.ceil((samples_count + 1) / 360.0),
+                                         max_samples_per_chunk=360L,
+                                         labels=[],
+                                         rules=[['tester_agg_max_10', 10L, 'AVG']])
     
     def test_create_compaction_rule_without_dest_series(self):
         with self.redis() as r:
@@ -270,13 +293,13 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
         with self.redis() as r:
             r.execute_command('ts.create', 'tester')
 
-            i = 0
             time_bucket = 10
             start_time = int(time.time())
             start_time = start_time - start_time % time_bucket
-            while i < 1000:
-                i += 1
-                r.execute_command('ts.incrby', 'tester', '1', 'RESET', time_bucket)
+            with r.pipeline(transaction=False) as p:
+                for i in xrange(1000):
+                    p.execute_command('ts.incrby', 'tester', '1', 'RESET', time_bucket)
+                p.execute()
 
             assert r.execute_command('TS.RANGE', 'tester', 0, int(time.time())) == [[start_time, '1000']]
 
@@ -285,12 +308,12 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
             r.execute_command('ts.create', 'tester')
 
             start_incr_time = int(time.time())
-            for i in range(20):
+            for i in xrange(20):
                 r.execute_command('ts.incrby', 'tester', '5')
 
             time.sleep(1)
             start_decr_time = int(time.time())
-            for i in range(20):
+            for i in xrange(20):
                 r.execute_command('ts.decrby', 'tester', '1.5')
 
             assert r.execute_command('TS.RANGE', 'tester', 0, int(time.time())) == [[start_incr_time, '100'], [start_decr_time, '70']]
@@ -373,11 +396,13 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
             assert r.execute_command('TS.CREATE', 'tester')
             rules = ['avg', 'sum', 'count', 'max', 'min']
             resolutions = [1, 3, 10, 1000]
-            for rule in rules:
-                for resolution in resolutions:
-                    assert r.execute_command('TS.CREATE', 'tester_{}_{}'.format(rule, resolution))
-                    assert r.execute_command('TS.CREATERULE', 'tester', 'tester_{}_{}'.format(rule, resolution),
-                                             'AGGREGATION', rule, resolution)
+            with r.pipeline(transaction=False) as p:
+                for rule in rules:
+                    for resolution in resolutions:
+                        p.execute_command('TS.CREATE', 'tester_{}_{}'.format(rule, resolution))
+                        p.execute_command('TS.CREATERULE', 'tester', 'tester_{}_{}'.format(rule, resolution),
+                                          'AGGREGATION', rule, resolution)
+                assert all(p.execute())
 
             start_ts = 0
             samples_count = 501
@@ -457,20 +482,23 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
         samples_count = 50
 
         with self.redis() as r:
-            assert r.execute_command('TS.CREATE', 'tester1', 'LABELS', 'name', 'bob', 'class', 'middle', 'generation', 'x')
-            assert r.execute_command('TS.CREATE', 'tester2', 'LABELS', 'name', 'rudy', 'class', 'junior', 'generation', 'x')
-            assert r.execute_command('TS.CREATE', 'tester3', 'LABELS', 'name', 'fabi', 'class', 'top', 'generation', 'x')
-            self._insert_data(r, 'tester1', start_ts, samples_count, 5)
-            self._insert_data(r, 'tester2', start_ts, samples_count, 15)
-            self._insert_data(r, 'tester3', start_ts, samples_count, 25)
+            with r.pipeline(transaction=False) as p:
+                p.execute_command('TS.CREATE', 'tester1', 'LABELS', 'name', 'bob', 'class', 'middle', 'generation', 'x')
+                p.execute_command('TS.CREATE', 'tester2', 'LABELS', 'name', 'rudy', 'class', 'junior', 'generation', 'x')
+                p.execute_command('TS.CREATE', 'tester3', 'LABELS', 'name', 'fabi', 'class', 'top', 'generation', 'x')
+                self._insert_data(p, 'tester1', start_ts, samples_count, 5)
+                self._insert_data(p, 'tester2', start_ts, samples_count, 15)
+                self._insert_data(p, 'tester3', start_ts, samples_count, 25)
+                assert all(p.execute())
 
 
-            expected_result = [[start_ts+i, str(5)] for i in range(samples_count)]
+            expected_result = [[start_ts+i, '5'] for i in xrange(samples_count)]
             actual_result = r.execute_command('TS.mrange', start_ts, start_ts + samples_count, 'FILTER', 'name=bob')
             assert [['tester1', [['name', 'bob'], ['class', 'middle'], ['generation', 'x']], expected_result]] == actual_result
 
             def build_expected(val, time_bucket):
-                return [[long(i - i%time_bucket), str(val)] for i in range(start_ts, start_ts+samples_count+1, time_bucket)]
+                val_str = str(val)
+                return [[long(i - i%time_bucket), val_str] for i in xrange(start_ts, start_ts+samples_count+1, time_bucket)]
             actual_result = r.execute_command('TS.mrange', start_ts, start_ts + samples_count, 'AGGREGATION', 'LAST', 5, 'FILTER', 'generation=x')
             expected_result = [['tester1', [['name', 'bob'], ['class', 'middle'], ['generation', 'x']], build_expected(5, 5)],
                     ['tester2', [['name', 'rudy'], ['class', 'junior'], ['generation', 'x']], build_expected(15, 5)],
@@ -483,10 +511,12 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
 
     def test_label_index(self):
         with self.redis() as r:
-            assert r.execute_command('TS.CREATE', 'tester1', 'LABELS', 'name', 'bob', 'class', 'middle', 'generation', 'x')
-            assert r.execute_command('TS.CREATE', 'tester2', 'LABELS', 'name', 'rudy', 'class', 'junior', 'generation', 'x')
-            assert r.execute_command('TS.CREATE', 'tester3', 'LABELS', 'name', 'fabi', 'class', 'top', 'generation', 'x', 'x', '2')
-            assert r.execute_command('TS.CREATE', 'tester4', 'LABELS', 'name', 'anybody', 'class', 'top', 'type', 'noone', 'x', '2', 'z', '3')
+            with r.pipeline(transaction=False) as p:
+                p.execute_command('TS.CREATE', 'tester1', 'LABELS', 'name', 'bob', 'class', 'middle', 'generation', 'x')
+                p.execute_command('TS.CREATE', 'tester2', 'LABELS', 'name', 'rudy', 'class', 'junior', 'generation', 'x')
+                p.execute_command('TS.CREATE', 'tester3', 'LABELS', 'name', 'fabi', 'class', 'top', 'generation', 'x', 'x', '2')
+                p.execute_command('TS.CREATE', 'tester4', 'LABELS', 'name', 'anybody', 'class', 'top', 'type', 'noone', 'x', '2', 'z', '3')
+                assert all(p.execute())
 
             assert ['tester1', 'tester2', 'tester3'] == r.execute_command('TS.QUERYINDEX', 'generation=x')
             assert ['tester1', 'tester2'] == r.execute_command('TS.QUERYINDEX', 'generation=x', 'x=')
@@ -506,8 +536,7 @@ class RedisTimeseriesTests(ModuleTestCase(os.path.dirname(os.path.abspath(__file
             chunk_size = 4
 
             r.execute_command("ts.create", 'test_key', 0, chunk_size)
-            for i in range(sample_len):
-                r.execute_command("ts.add", 'test_key', i , i)
+            self._insert_data(r, 'test_key', 0, sample_len, range(sample_len))
 
             res = r.execute_command('ts.range', 'test_key', 0, sample_len)
             i = 0
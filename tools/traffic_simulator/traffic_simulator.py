@@ -1,30 +1,58 @@
 import redis
 import time
 import click
+import itertools
 import multiprocessing
 import sys
 
 
-def worker_func(args):
-    host, port, start_ts, tsrange, pipeline_size, key_index, key_format, check_only = args
-    redis_client = redis.Redis(host, port)
-    if check_only:
-        res = redis_client.execute_command('TS.RANGE', key_format.format(index=key_index), 0, start_ts + tsrange)
-        if len(res) != tsrange:
-            return -1
-        expected = [[long(start_ts + i), str(i)] for i in xrange(tsrange)]
-        if expected != res:
-            return -1
-    else:
-        pipe = redis_client.pipeline(tsrange)
-        for i in xrange(tsrange):
-            if tsrange % pipeline_size:
-                pipe.execute()
-            pipe.execute_command("ts.add", key_format.format(index=key_index), start_ts + i, i)
+def check_key(redis_client, key_name, start_ts, tsrange):
+    end_ts = start_ts + tsrange
+    res = redis_client.execute_command('TS.RANGE', key_name, 0, end_ts)
+    if len(res) != tsrange:
+        return -1
+    expected = [[long(start_ts + i), str(i)] for i in xrange(tsrange)]
+    if expected != res:
+        return -1
+    return tsrange
+
+
+def insert_key(pipe, key_name, start_ts, tsrange, pipeline_size):
+    for base in xrange(0, tsrange, pipeline_size):
+        for i in xrange(base, min(base + pipeline_size, tsrange)):
+            pipe.execute_command("ts.add", key_name, start_ts + i, i)
         pipe.execute()
     return tsrange
 
 
+def connect(host, port):
+    # redis-py already sets TCP_NODELAY on its sockets, so small pipeline flushes are not delayed by Nagle
+    return redis.Redis(host=host, port=port, socket_keepalive=True, socket_connect_timeout=5, socket_timeout=30)
+
+
+# connection of the current worker process, opened once by init_worker
+worker_redis = None
+
+
+def init_worker(host, port):
+    global worker_redis
+    worker_redis = connect(host, port)
+
+
+def worker_func(args):
+    start_ts, tsrange, pipeline_size, key_indices, key_format, check_only = args
+    redis_client = worker_redis
+    pipe = redis_client.pipeline(transaction=False)
+    results = []
+    for key_index in key_indices:
+        key_name = key_format.format(index=key_index)
+        if check_only:
+            results.append(check_key(redis_client, key_name, start_ts, tsrange))
+        else:
+            results.append(insert_key(pipe, key_name, start_ts, tsrange, pipeline_size))
+    return results
+
+
 def create_compacted_key(redis, i, source, agg, bucket):
     dest = '%s_%s_%s' % (source, agg, bucket)
     redis.delete(dest)
@@ -48,24 +76,28 @@ def create_compacted_key(redis, i, source, agg, bucket):
 @click.option('--check-only', type=click.BOOL, default=False, help='test if all keys are correcly exists in the database')
 def run(host, port, key_count, samples, pool_size, create_keys, pipeline_size, with_compaction, start_timestamp,
         key_format, check_only):
-    r = redis.Redis(host, port)
+    r = connect(host, port)
     print("from %s to %s" % (start_timestamp, start_timestamp + samples))
 
     if create_keys and not check_only:
-        for i in range(key_count):
-            keyname = key_format.format(index=i)
-            r.delete(keyname)
-            r.execute_command('ts.create', keyname, 'RETENTION', 0, 'CHUNK_SIZE', 360, 'LABELS', 'index', i)
-            if with_compaction:
-                create_compacted_key(r, i, keyname, 'avg', 10)
-                create_compacted_key(r, i, keyname, 'avg', 60)
-                create_compacted_key(r, i, keyname, 'count', 10)
-
-    pool = multiprocessing.Pool(pool_size)
+        with r.pipeline(transaction=False) as pipe:
+            for i in xrange(key_count):
+                keyname = key_format.format(index=i)
+                pipe.delete(keyname)
+                pipe.execute_command('ts.create', keyname, 'RETENTION', 0, 'CHUNK_SIZE', 360, 'LABELS', 'index', i)
+                if with_compaction:
+                    create_compacted_key(pipe, i, keyname, 'avg', 10)
+                    create_compacted_key(pipe, i, keyname, 'avg', 60)
+                    create_compacted_key(pipe, i, keyname, 'count', 10)
+            pipe.execute()
+
+    pool = multiprocessing.Pool(pool_size, initializer=init_worker, initargs=(host, port))
     s = time.time()
-    result = pool.map(worker_func,
-                      [(host, port, start_timestamp, int(samples), pipeline_size, key_index, key_format, check_only)
-                       for key_index in range(key_count)])
+    keys_per_task = max(1, -(-key_count // pool_size))
+    tasks = [(start_timestamp, int(samples), pipeline_size,
+              range(first_key, min(first_key + keys_per_task, key_count)), key_format, check_only)
+             for first_key in xrange(0, key_count, keys_per_task)]
+    result = list(itertools.chain.from_iterable(pool.imap_unordered(worker_func, tasks)))
     e = time.time()
     insert_time = e - s
 